@@ -0,0 +1,60 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# Radian columns stored alongside scale coordinates so the app never converts at runtime
+SCALE_RADIAN_COLUMNS = {'Latitude': 'LatitudeRad', 'Longitude': 'LongitudeRad'}
+
+def stringify_mixed_columns(df):
+    """Cast mixed-type object columns (e.g. numeric and text postal codes) to strings so Arrow can store them"""
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) not in ('string', 'empty'):
+            df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v))
+    return df
+
+def prepare_cat_scales(df):
+    """Store scale coordinates as float32 plus precomputed float32 radians"""
+    for col, rad_col in SCALE_RADIAN_COLUMNS.items():
+        df[col] = df[col].astype(np.float32)
+        df[rad_col] = np.radians(df[col]).astype(np.float32)
+    return df
+
+DATA_FILES = {
+    'data/cat_scales.xlsx': prepare_cat_scales,
+    'data/Cargo_claims_data.xlsx': None,
+}
+
+def parquet_path(input_file):
+    """Path of the Parquet copy kept next to an XLSX data file"""
+    return input_file.rsplit('.', 1)[0] + '.parquet'
+
+def convert_to_parquet(input_file, prepare=None):
+    """Write a zstd-compressed Parquet copy next to an XLSX data file and return the written frame"""
+    output_file = parquet_path(input_file)
+    df = stringify_mixed_columns(pd.read_excel(input_file))
+    if prepare:
+        df = prepare(df)
+    df.to_parquet(output_file, compression='zstd', index=False)
+    logger.info("Converted '%s' to '%s'", input_file, output_file)
+    return df
+
+def read_with_parquet_cache(input_file, prepare=None, columns=None):
+    """Read an XLSX data file through its Parquet copy, regenerating the copy when missing, stale or incomplete"""
+    output_file = parquet_path(input_file)
+    if os.path.exists(output_file):
+        is_stale = os.path.exists(input_file) and os.path.getmtime(input_file) > os.path.getmtime(output_file)
+        has_columns = columns is None or set(columns) <= set(pq.read_schema(output_file).names)
+        if not is_stale and has_columns:
+            return pd.read_parquet(output_file, columns=columns)
+
+    df = convert_to_parquet(input_file, prepare)
+    return df[columns] if columns else df
+
+if __name__ == '__main__':
+    for data_file, prepare in DATA_FILES.items():
+        convert_to_parquet(data_file, prepare)
+        print(f"Converted '{data_file}' to '{parquet_path(data_file)}'")
@@ -0,0 +1,116 @@
+import math
+import numpy as np
+from numba import njit
+
+EARTH_RADIUS_MILES = 3958.7613     # Mean Earth radius used for great-circle distances
+EARTH_RADIUS_MILES_F32 = np.float32(EARTH_RADIUS_MILES)
+
+GRID_CELL_DEG = 1.0                # Uniform lat/lon grid used to prune route corridors
+GRID_COLS = int(360 / GRID_CELL_DEG) + 1
+# Farthest any point of a grid cell can be from the cell center (half-diagonal at the equator)
+GRID_CELL_HALF_DIAGONAL_MILES = EARTH_RADIUS_MILES * math.radians(GRID_CELL_DEG) * math.sqrt(0.5)
+
+# fastmath without the no-NaN/no-Inf assumptions, since non-viable scales score inf
+FASTMATH_FLAGS = {'nsz', 'arcp', 'contract', 'afn', 'reassoc'}
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """Great-circle distance in miles between points given in radians.
+
+    Works on scalars or NumPy arrays (broadcast), so one origin can be measured
+    against every CAT scale in a single call.
+    """
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+def point_distance_miles(coords1, coords2):
+    """Haversine miles between two (lat, lon) points in degrees, using scalar math only"""
+    lat1, lon1 = math.radians(coords1[0]), math.radians(coords1[1])
+    lat2, lon2 = math.radians(coords2[0]), math.radians(coords2[1])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(min(a, 1.0)))
+
+def great_circle_midpoint(lat1, lon1, lat2, lon2):
+    """Midpoint (lat, lon) in radians of the great-circle arc between two points"""
+    bx = np.cos(lat2) * np.cos(lon2 - lon1)
+    by = np.cos(lat2) * np.sin(lon2 - lon1)
+    lat_mid = np.arctan2(np.sin(lat1) + np.sin(lat2), np.sqrt((np.cos(lat1) + bx) ** 2 + by ** 2))
+    lon_mid = lon1 + np.arctan2(by, np.cos(lat1) + bx)
+    return lat_mid, lon_mid
+
+def grid_cell_ids(lat_deg, lon_deg):
+    """Integer id of the uniform grid cell containing each point (degrees)"""
+    rows = np.floor((np.asarray(lat_deg) + 90) / GRID_CELL_DEG).astype(np.int64)
+    cols = np.floor((np.asarray(lon_deg) + 180) / GRID_CELL_DEG).astype(np.int64)
+    return rows * GRID_COLS + cols
+
+def corridor_cell_mask(cell_ids, lat1, lon1, lat2, lon2, max_route_miles):
+    """Mask of grid cells that may hold a point whose detour via it is within max_route_miles.
+
+    Endpoints are in radians. A cell is tested at its center with one
+    half-diagonal of slack per leg, so no qualifying point is ever dropped.
+    """
+    unique_ids, inverse = np.unique(cell_ids, return_inverse=True)
+    center_lat = np.radians((unique_ids // GRID_COLS + 0.5) * GRID_CELL_DEG - 90)
+    center_lon = np.radians((unique_ids % GRID_COLS + 0.5) * GRID_CELL_DEG - 180)
+    via_center = (haversine_miles(lat1, lon1, center_lat, center_lon) +
+                  haversine_miles(center_lat, center_lon, lat2, lon2))
+    return (via_center - 2 * GRID_CELL_HALF_DIAGONAL_MILES <= max_route_miles)[inverse.ravel()]
+
+@njit('f4(f4, f4, f4, f4)', fastmath=FASTMATH_FLAGS, cache=True)
+def _haversine_miles_f4(dlat, dlon, cos_lat1, cos_lat2):
+    """Haversine miles from coordinate deltas, given the cosines of both latitudes"""
+    a = math.sin(dlat / 2) ** 2 + cos_lat1 * cos_lat2 * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES_F32 * math.asin(math.sqrt(min(a, np.float32(1.0))))
+
+@njit('f8(f4, f4, f4, f8, f8, f8, f8, f8, f8)', fastmath=FASTMATH_FLAGS, cache=True)
+def _scale_score(to_s, from_s, base, max_deviation, exempt_radius,
+                 speed_mph, hourly_rate, detour_mile_bonus, scale_cost):
+    """Combined deviation/cost/proximity score of one scale; inf when it deviates too far"""
+    diff = to_s + from_s - base
+    dev = diff / base
+    if dev > max_deviation:
+        return np.inf
+    cost = diff / speed_mph * hourly_rate + diff * detour_mile_bonus + scale_cost
+    score = dev * 100 + cost / 50
+    if to_s > exempt_radius:
+        score += to_s / 100
+    return score
+
+@njit('Tuple((i8, f8))(f4, f4, f4, f4, f4[::1], f4[::1], f8, b1, f8, f8, f8, f8)',
+      fastmath=FASTMATH_FLAGS, cache=True)
+def best_scale_kernel(lat1, lon1, lat2, lon2, lats, lons, max_deviation, high_risk,
+                      speed_mph, hourly_rate, detour_mile_bonus, scale_cost):
+    """Score every scale in one fused pass and return (best_index, best_score).
+
+    Mirrors the detour cost model and scoring of find_best_cat_scale. Scales
+    deviating more than max_deviation from the route are skipped; best_index
+    is -1 when no scale qualifies.
+    
+    Distances are haversine, sharing one cosine per scale between both legs.
+    Coordinates are float32 (sub-meter at these magnitudes) to halve memory
+    traffic. Report final numbers with point_distance_miles (float64).
+    """
+    cos_lat1 = math.cos(lat1)
+    cos_lat2 = math.cos(lat2)
+    base = _haversine_miles_f4(lat2 - lat1, lon2 - lon1, cos_lat1, cos_lat2)
+    # Scales this close to the origin are exempt from the proximity term, but only
+    # on high-risk routes; resolved once here instead of per scale
+    exempt_radius = 100.0 if high_risk else -1.0
+    
+    # Serial loop tracking the running minimum: corridor candidate sets are small
+    # enough that thread start-up costs more than it saves, and no score array is needed
+    best = -1
+    best_score = np.inf
+    for i in range(lats.shape[0]):
+        cos_lat = math.cos(lats[i])
+        to_s = _haversine_miles_f4(lats[i] - lat1, lons[i] - lon1, cos_lat1, cos_lat)
+        from_s = _haversine_miles_f4(lat2 - lats[i], lon2 - lons[i], cos_lat, cos_lat2)
+        score = _scale_score(to_s, from_s, base, max_deviation, exempt_radius,
+                             speed_mph, hourly_rate, detour_mile_bonus, scale_cost)
+        if score < best_score:
+            best = i
+            best_score = score
+    
+    return best, best_score
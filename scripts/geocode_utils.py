@@ -0,0 +1,49 @@
+import shelve
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from geopy.geocoders import Nominatim
+
+GEOCODE_CACHE_FILE = 'data/geocache'   # Persistent shelve of normalized query -> (lat, lon)
+
+geolocator = Nominatim(user_agent="truck_scaling_app")
+_cache_lock = threading.Lock()
+
+def normalize_location(location_str):
+    """Normalize a location string into the key used by the geocoding cache"""
+    return location_str.strip().upper()
+
+@lru_cache(maxsize=4096)
+def geocode(key):
+    """Get (latitude, longitude) for a normalized location, or None if not found.
+
+    Results are kept in memory for the life of the process and on disk across
+    restarts, so Nominatim is only queried once per distinct location. Errors
+    propagate and are not cached.
+    """
+    with _cache_lock, shelve.open(GEOCODE_CACHE_FILE) as cache:
+        if key in cache:
+            return cache[key]
+    
+    location = geolocator.geocode(key)
+    coords = (location.latitude, location.longitude) if location else None
+    
+    with _cache_lock, shelve.open(GEOCODE_CACHE_FILE) as cache:
+        cache[key] = coords
+    return coords
+
+def geocode_many(keys):
+    """Geocode several normalized locations concurrently.
+
+    Returns a dict mapping each key to its (lat, lon) / None result, or to the
+    exception raised while looking it up, so callers can report failures.
+    """
+    unique_keys = list(dict.fromkeys(keys))
+    with ThreadPoolExecutor(max_workers=max(len(unique_keys), 1)) as executor:
+        futures = {key: executor.submit(geocode, key) for key in unique_keys}
+    
+    results = {}
+    for key, future in futures.items():
+        error = future.exception()
+        results[key] = error if error else future.result()
+    return results
@@ -1,42 +1,153 @@
 import streamlit as st
 import pandas as pd
-from geopy.geocoders import Nominatim
-from geopy.distance import geodesic
-from risk_utils import calculate_route_risk, calculate_liable_party_risk, get_risk_recommendation
+import numpy as np
+from risk_utils import (
+    ROUTE_KEY_COLUMNS, ROUTE_RATING_COLUMNS, PARTY_RATING_COLUMNS,
+    use_arrow_strings, build_route_index, build_party_index,
+    calculate_route_risk, calculate_liable_party_risk, get_risk_recommendation
+)
 import os
+import logging
 from datetime import datetime
-from isochrone_utils import get_isochrone, find_scales_in_isochrone
-from map_utils import create_route_map
+from typing import NamedTuple, Optional
+from isochrone_utils import fetch_isochrone, scale_indices_in_isochrone, scale_rows
+from map_utils import build_base_map, add_route_analysis, finish_route_map
+from geocode_utils import geocode_many, normalize_location
+from distance_utils import (
+    EARTH_RADIUS_MILES, point_distance_miles, great_circle_midpoint,
+    grid_cell_ids, corridor_cell_mask, best_scale_kernel
+)
+from convert_to_parquet import SCALE_RADIAN_COLUMNS, prepare_cat_scales, read_with_parquet_cache
+from sklearn.neighbors import BallTree
 from streamlit_folium import folium_static
 
+logger = logging.getLogger(__name__)
+
 # --- Constants & Configurations ---
 CAT_SCALE_COST = 14.0              # Fixed cost for weighing at a cat scale
 DRIVER_BASE_HOURLY = 17.0          # Base hourly rate for all driving
 DRIVER_DIRECT_MILE_BONUS = 0.50    # Additional pay per mile on direct route #remove
 DRIVER_DETOUR_MILE_BONUS = 0.25    # Additional pay per mile when out of route #remove
 AVERAGE_SPEED_MPH = 50.0           # Assumed average speed in mph
+HIGH_RISK_ROUTE_SCORE = 0.7        # Route risk at which nearby scales are favored
+
+CAT_SCALE_COLUMNS = [
+    'CATScaleNumber', 'State', 'InterstateCity', 'TruckstopName',
+    'InterstateAddress', 'Latitude', 'Longitude'
+]
+RISK_RATING_SHEETS = ['Route Risk Ratings', 'Liable Party Risk Ratings']
+RISK_RATING_COLUMNS = dict(zip(RISK_RATING_SHEETS, [ROUTE_RATING_COLUMNS, PARTY_RATING_COLUMNS]))
+
+# --- Data Loaders (cached across Streamlit reruns) ---
+# XLSX files are read through Parquet copies (far faster), refreshed whenever the XLSX is newer.
+# Loaders persist to disk, keyed on the source files' modification times so edits are picked up.
+def data_file_mtimes(*paths):
+    """Modification time of each data file (None if missing), used as a cache key"""
+    return tuple(os.path.getmtime(p) if os.path.exists(p) else None for p in paths)
+
+@st.cache_data(show_spinner=False, persist="disk")
+def load_cat_scales(source_mtimes=None):
+    """Read CAT scale locations, keeping only the required columns"""
+    return read_with_parquet_cache(
+        "data/cat_scales.xlsx", prepare_cat_scales,
+        columns=CAT_SCALE_COLUMNS + list(SCALE_RADIAN_COLUMNS.values())
+    )
+
+@st.cache_data(show_spinner=False, persist="disk")
+def load_incident_data(source_mtimes=None):
+    """Read historical cargo claims"""
+    return read_with_parquet_cache("data/Cargo_claims_data.xlsx")
+
+@st.cache_resource(show_spinner=False)
+def load_risk_tables(risk_file):
+    """Read a generated risk ratings workbook and index both sheets for O(1) lookups"""
+    # Prefer the Parquet copies risk_analysis.py writes next to the workbook
+    risk_base = risk_file.rsplit('.', 1)[0]
+    parquet_files = dict(zip(RISK_RATING_SHEETS, [f"{risk_base}_routes.parquet", f"{risk_base}_parties.parquet"]))
+    if all(os.path.exists(f) for f in parquet_files.values()):
+        sheets = {sheet: pd.read_parquet(f, columns=RISK_RATING_COLUMNS[sheet]) for sheet, f in parquet_files.items()}
+    else:
+        needed = set(ROUTE_RATING_COLUMNS + PARTY_RATING_COLUMNS)
+        sheets = pd.read_excel(risk_file, sheet_name=RISK_RATING_SHEETS, usecols=lambda col: col in needed)
+    sheets = {sheet: use_arrow_strings(df) for sheet, df in sheets.items()}
+    return (
+        build_route_index(sheets['Route Risk Ratings']),
+        build_party_index(sheets['Liable Party Risk Ratings'])
+    )
+
+@st.cache_resource(show_spinner=False)
+def build_scale_tree(lat_rad, lon_rad):
+    """Haversine BallTree over scale coordinates (radians), built once per process"""
+    return BallTree(np.column_stack([lat_rad, lon_rad]), metric='haversine')
 
 # --- Load Cat Scale Data ---
+cat_scale_mtimes = data_file_mtimes("data/cat_scales.parquet", "data/cat_scales.xlsx")
 try:
-    # Specify the required columns when reading the file
-    cat_scales = pd.read_excel("data/cat_scales.xlsx", usecols=[
-        'CATScaleNumber', 'State', 'InterstateCity', 'TruckstopName',
-        'InterstateAddress', 'Latitude', 'Longitude'
-    ])
+    cat_scales = load_cat_scales(cat_scale_mtimes)
 except Exception as e:
     st.error(f"Error loading cat scales file: {e}")
     # Create empty DataFrame with correct columns
-    cat_scales = pd.DataFrame(columns=[
-        'CATScaleNumber', 'State', 'InterstateCity', 'TruckstopName',
-        'InterstateAddress', 'Latitude', 'Longitude'
-    ])
+    cat_scales = pd.DataFrame(columns=CAT_SCALE_COLUMNS + list(SCALE_RADIAN_COLUMNS.values()))
+
+# Scale coordinates as contiguous arrays so the search never touches the DataFrame
+scale_lat = np.ascontiguousarray(cat_scales['Latitude'].to_numpy(dtype=np.float64))
+scale_lon = np.ascontiguousarray(cat_scales['Longitude'].to_numpy(dtype=np.float64))
+# Radians in float32 (stored in the Parquet copy) for the scoring kernel; ample precision for ranking scales
+scale_lat_rad = np.ascontiguousarray(cat_scales['LatitudeRad'].to_numpy(dtype=np.float32))
+scale_lon_rad = np.ascontiguousarray(cat_scales['LongitudeRad'].to_numpy(dtype=np.float32))
+# States as integer codes, so the same-state filter compares ints instead of strings
+scale_state_codes, scale_state_labels = pd.factorize(cat_scales['State'])
+state_codes = {state: code for code, state in enumerate(scale_state_labels)}
+
+# Display names formatted once, indexed by the winning scale position
+scale_display_names = (
+    cat_scales['TruckstopName'].astype(str) + ' - ' + cat_scales['InterstateCity'].astype(str) + ', ' +
+    cat_scales['State'].astype(str) + ' (#' + cat_scales['CATScaleNumber'].astype(str) + ')'
+).to_numpy()
+
+# Upper-cased (state, city) of every scale, for O(1) "is this a CAT scale location" checks
+scale_location_keys = set(zip(cat_scales['State'].str.upper(), cat_scales['InterstateCity'].str.upper()))
+
+# Grid cell of each scale, used to trim the radius query down to the route corridor
+scale_cell_ids = grid_cell_ids(scale_lat, scale_lon)
+
+# Spatial index over scale coordinates so route queries only touch nearby scales
+scale_tree = build_scale_tree(scale_lat_rad, scale_lon_rad) if len(cat_scales) else None
+
+@st.cache_resource(show_spinner=False)
+def index_incident_data(_incident_data, source_mtimes):
+    """Per-party expense stats and a route-keyed incident index, rebuilt only when the claims files change"""
+    # Average expense and incident count per liable party (lower-cased)
+    party_stats = (
+        _incident_data.groupby(_incident_data["Liable Party Name"].str.lower())["Total Expense"]
+        .agg(['mean', 'size'])
+        .to_dict('index')
+    )
+    # Incidents indexed by upper-cased route so a route's history is a single lookup
+    route_index = _incident_data.set_index(
+        [_incident_data[col].str.upper() for col in ROUTE_KEY_COLUMNS]
+    ).sort_index()
+    return party_stats, route_index
 
 # --- Load Historical Incident Data ---
+incident_mtimes = data_file_mtimes("data/Cargo_claims_data.parquet", "data/Cargo_claims_data.xlsx")
 try:
-    incident_data = pd.read_excel("data/Cargo_claims_data.xlsx")
+    incident_data = load_incident_data(incident_mtimes)
 except Exception as e:
     st.error(f"Error loading cargo claims file: {e}")
-    incident_data = pd.DataFrame(columns=["Loss City/State", "Ship From", "Ship To", "Liable Party Name", "Total Expense", "Weight"])
+    incident_data = pd.DataFrame(columns=["Loss City/State", "Ship From", "Ship To", "Liable Party Name", "Total Expense", "Weight"] + ROUTE_KEY_COLUMNS)
+
+party_expense_stats, incident_index = index_incident_data(incident_data, incident_mtimes)
+
+@st.cache_data(show_spinner=False, max_entries=4096)
+def get_historical_loss(ship_from_city, ship_from_state, ship_to_city, ship_to_state, source_mtimes=None):
+    """(Loss City, Loss State) of the route's first historical incident (case-insensitive), or None"""
+    route_key = (ship_from_city.upper(), ship_from_state.upper(), ship_to_city.upper(), ship_to_state.upper())
+    try:
+        first_incident = incident_index.loc[[route_key]].iloc[0]
+    except KeyError:
+        return None
+    return first_incident['Loss City'], first_incident['Loss State']
 
 # --- Load Risk Ratings Data ---
 def get_latest_risk_ratings():
@@ -46,44 +157,68 @@ def get_latest_risk_ratings():
             latest_file = f.read().strip()
         
         if os.path.exists(latest_file):
-            return pd.read_excel(latest_file, sheet_name=['Route Risk Ratings', 'Liable Party Risk Ratings'])
+            return load_risk_tables(latest_file)
         else:
             # Fall back to finding most recent file
-            risk_files = [f for f in os.listdir('data') if f.startswith('risk_ratings_')]
+            risk_files = [f for f in os.listdir('data') if f.startswith('risk_ratings_') and f.endswith('.xlsx')]
             if risk_files:
                 latest_file = max(risk_files)
-                return pd.read_excel(f"data/{latest_file}", sheet_name=['Route Risk Ratings', 'Liable Party Risk Ratings'])
+                return load_risk_tables(f"data/{latest_file}")
     except Exception as e:
         st.error(f"Error loading risk ratings: {e}")
     
-    return {
-        'Route Risk Ratings': pd.DataFrame(),
-        'Liable Party Risk Ratings': pd.DataFrame()
-    }
+    return {}, {}
 
-risk_ratings = get_latest_risk_ratings()
+# --- Isochrones ---
+# In-memory only: Streamlit ignores ttl on disk-persisted caches, and isochrones should expire hourly
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_isochrone_cached(coords, drive_time_minutes=30):
+    """ORS isochrone memoized per (rounded) origin for an hour; failures raise and are not cached"""
+    return fetch_isochrone(coords, drive_time_minutes)
 
-# --- Geocoding Setup ---
-geolocator = Nominatim(user_agent="truck_scaling_app")
+@st.cache_data(ttl=3600, show_spinner=False)
+def scale_indices_in_isochrone_cached(coords, drive_time_minutes=30, source_mtimes=None):
+    """Positions of the CAT scales inside the (rounded) origin's isochrone, per scale data version"""
+    return scale_indices_in_isochrone(fetch_isochrone_cached(coords, drive_time_minutes), scale_lat, scale_lon)
 
-def get_coordinates(location_str):
-    """Get (latitude, longitude) tuple for a given location string."""
+def get_isochrone_scales(coords, drive_time_minutes=30):
+    """Isochrone polygon around coords and the scales within it, shared by origins within ~100 m; (None, []) on API errors"""
+    rounded_coords = (round(coords[0], 3), round(coords[1], 3))
     try:
-        location = geolocator.geocode(location_str)
-        if location:
-            return (location.latitude, location.longitude)
-        else:
-            return None
+        polygon = fetch_isochrone_cached(rounded_coords, drive_time_minutes)
+        indices = scale_indices_in_isochrone_cached(rounded_coords, drive_time_minutes, cat_scale_mtimes)
     except Exception as e:
-        st.error(f"Error geocoding '{location_str}': {e}")
-        return None
+        logger.warning("Error getting isochrone: %s", e)
+        return None, []
+    return polygon, scale_rows(cat_scales, indices)
+
+# --- Geocoding Setup ---
+def get_coordinates_many(location_strs):
+    """Geocode several locations in one concurrent batch; None where not found or failed."""
+    results = geocode_many([normalize_location(s) for s in location_strs])
+    coords = []
+    for location_str in location_strs:
+        result = results[normalize_location(location_str)]
+        if isinstance(result, Exception):
+            st.error(f"Error geocoding '{location_str}': {result}")
+            result = None
+        coords.append(result)
+    return coords
+
+def route_leg_distances(ship_from_coords, ship_to_coords, cat_scale_coords, direct_route=None):
+    """Great-circle miles for the direct route and both legs via the scale"""
+    if direct_route is None:
+        direct_route = point_distance_miles(ship_from_coords, ship_to_coords)
+    to_scale = point_distance_miles(ship_from_coords, cat_scale_coords)
+    from_scale = point_distance_miles(cat_scale_coords, ship_to_coords)
+    return direct_route, to_scale, from_scale
 
-def calculate_detour_cost(ship_from_coords, ship_to_coords, cat_scale_coords):
+def calculate_detour_cost(ship_from_coords, ship_to_coords, cat_scale_coords, base_distance=None):
     """Calculate detour costs with combined hourly and per-mile rates"""
-    # Calculate distances
-    direct_route = geodesic(ship_from_coords, ship_to_coords).miles
-    to_scale = geodesic(ship_from_coords, cat_scale_coords).miles
-    from_scale = geodesic(cat_scale_coords, ship_to_coords).miles
+    # Calculate distances (base_distance is the precomputed direct route, if known)
+    direct_route, to_scale, from_scale = route_leg_distances(
+        ship_from_coords, ship_to_coords, cat_scale_coords, base_distance
+    )
     
     # Calculate route with scale and detour distance
     route_with_scale = to_scale + from_scale
@@ -101,29 +236,54 @@ def calculate_detour_cost(ship_from_coords, ship_to_coords, cat_scale_coords):
     # Total detour cost includes hourly pay, mileage bonus, and scale fee
     total_detour_cost = detour_hourly_pay + detour_mileage_bonus + CAT_SCALE_COST
     
-    # Detailed debug output
-    print(f"\nDetailed Cost Breakdown:")
-    print(f"Direct route: {direct_route:.2f} miles ({direct_time:.2f} hours)")
-    print(f"Detour stats:")
-    print(f"- Additional distance: {detour_distance:.2f} miles")
-    print(f"- Additional time: {detour_time:.2f} hours")
-    print(f"Cost components:")
-    print(f"- Hourly pay: {detour_time:.2f} hrs * ${DRIVER_BASE_HOURLY}/hr = ${detour_hourly_pay:.2f}")
-    print(f"- Mileage bonus: {detour_distance:.2f} mi * ${DRIVER_DETOUR_MILE_BONUS}/mi = ${detour_mileage_bonus:.2f}")
-    print(f"- Scale fee: ${CAT_SCALE_COST:.2f}")
-    print(f"Total detour cost: ${total_detour_cost:.2f}")
+    # Detailed debug output (formatted only when debug logging is enabled)
+    logger.debug(
+        "Detailed Cost Breakdown:\n"
+        "Direct route: %.2f miles (%.2f hours)\n"
+        "Detour stats:\n"
+        "- Additional distance: %.2f miles\n"
+        "- Additional time: %.2f hours\n"
+        "Cost components:\n"
+        "- Hourly pay: %.2f hrs * $%s/hr = $%.2f\n"
+        "- Mileage bonus: %.2f mi * $%s/mi = $%.2f\n"
+        "- Scale fee: $%.2f\n"
+        "Total detour cost: $%.2f",
+        direct_route, direct_time,
+        detour_distance,
+        detour_time,
+        detour_time, DRIVER_BASE_HOURLY, detour_hourly_pay,
+        detour_distance, DRIVER_DETOUR_MILE_BONUS, detour_mileage_bonus,
+        CAT_SCALE_COST,
+        total_detour_cost
+    )
     
     return total_detour_cost, detour_distance, detour_hourly_pay, detour_time
 
-def calculate_path_deviation(point_coords, from_coords, to_coords):
-    """Calculate how far a point deviates from the direct route path"""
-    route_distance = geodesic(from_coords, to_coords).miles
-    via_point_distance = geodesic(from_coords, point_coords).miles + geodesic(point_coords, to_coords).miles
-    return (via_point_distance - route_distance) / route_distance  # Returns percentage deviation
+class ScaleResult(NamedTuple):
+    """Recommended scale and the detour it costs; coords and pay fields are None when no scale qualifies"""
+    name: str
+    detour_cost: float
+    coords: Optional[tuple]
+    driver_pay: Optional[float]
+    detour_time: Optional[float]
+    detour_distance: Optional[float]
 
-def find_best_cat_scale(ship_from_coords, ship_to_coords, route_risk=0.0, origin_state=None):
+def find_best_cat_scale(ship_from_coords, ship_to_coords, route_risk=0.0, origin_state=None, route_distance=None):
     """Find the optimal cat scale location considering route corridor and state"""
-    total_distance = geodesic(ship_from_coords, ship_to_coords).miles
+    # Route risk only matters through the high-risk threshold, so key the cache on that.
+    # The cache holds plain tuples; ScaleResult lives in this rerun-scoped script.
+    return ScaleResult(*_find_best_cat_scale_cached(
+        tuple(ship_from_coords), tuple(ship_to_coords),
+        route_risk >= HIGH_RISK_ROUTE_SCORE, origin_state, cat_scale_mtimes, route_distance
+    ))
+
+@st.cache_data(show_spinner=False, max_entries=4096)
+def _find_best_cat_scale_cached(ship_from_coords, ship_to_coords, high_risk, origin_state,
+                                source_mtimes=None, _route_distance=None):
+    """Scale search for one lane, memoized across reruns for repeated lanes and per scale data version"""
+    total_distance = _route_distance
+    if total_distance is None:
+        total_distance = point_distance_miles(ship_from_coords, ship_to_coords)
     max_deviation = 0.15  # Allow 15% path deviation
     
     # For longer routes, be more lenient with deviation
@@ -132,65 +292,59 @@ def find_best_cat_scale(ship_from_coords, ship_to_coords, route_risk=0.0, origin
     elif total_distance > 1000:
         max_deviation = 0.25
     
-    # First try to find scales in the same state
-    state_scales = cat_scales[cat_scales['State'] == origin_state] if origin_state else cat_scales
+    if scale_tree is None:
+        return "No suitable scale found", float('inf'), None, None, None, None
     
-    # Find all scales within reasonable deviation from route
-    viable_scales = []
-    for _, scale in state_scales.iterrows():
-        scale_coords = (scale['Latitude'], scale['Longitude'])
-        deviation = calculate_path_deviation(scale_coords, ship_from_coords, ship_to_coords)
-        
-        if deviation <= max_deviation:
-            detour_cost, extra_distance, driver_pay, detour_time = calculate_detour_cost(
-                ship_from_coords, ship_to_coords, scale_coords
-            )
-            from_origin_dist = geodesic(ship_from_coords, scale_coords).miles
-            
-            print(f"\nEvaluating scale in {scale['State']}: {scale['TruckstopName']} - {scale['InterstateCity']}")
-            print(f"Distance from origin: {from_origin_dist:.1f} miles")
-            
-            viable_scales.append({
-                'scale': scale,
-                'deviation': deviation,
-                'detour_cost': detour_cost,
-                'distance': extra_distance,
-                'detour_time': detour_time,
-                'driver_pay': driver_pay,
-                'from_origin': from_origin_dist
-            })
+    from_lat, from_lon = np.radians(ship_from_coords)
+    to_lat, to_lon = np.radians(ship_to_coords)
+    
+    # A scale within max_deviation lies inside the ellipse with foci at origin and
+    # destination, which fits in a circle around the route midpoint
+    corridor_radius = total_distance * (1 + max_deviation) / 2 / EARTH_RADIUS_MILES
+    candidates = np.sort(scale_tree.query_radius([great_circle_midpoint(from_lat, from_lon, to_lat, to_lon)], r=corridor_radius)[0])
+    
+    # Keep only scales in grid cells the ellipse actually reaches
+    if len(candidates):
+        in_corridor = corridor_cell_mask(
+            scale_cell_ids[candidates], from_lat, from_lon, to_lat, to_lon,
+            total_distance * (1 + max_deviation)
+        )
+        candidates = candidates[in_corridor]
+    
+    # First try to find scales in the same state (unknown states match nothing; -1 marks missing)
+    if origin_state:
+        candidates = candidates[scale_state_codes[candidates] == state_codes.get(origin_state, -2)]
+    
+    # Score the remaining candidates at once in the compiled kernel
+    best_idx, best_score = best_scale_kernel(
+        from_lat, from_lon, to_lat, to_lon,
+        scale_lat_rad[candidates], scale_lon_rad[candidates],
+        max_deviation, high_risk,
+        AVERAGE_SPEED_MPH, DRIVER_BASE_HOURLY, DRIVER_DETOUR_MILE_BONUS, CAT_SCALE_COST
+    )
     
     # If no viable scales in same state, try all states
-    if not viable_scales and origin_state:
-        print(f"\nNo viable scales found in {origin_state}, checking all states...")
-        return find_best_cat_scale(ship_from_coords, ship_to_coords, route_risk, None)
+    if best_idx < 0 and origin_state:
+        logger.debug("No viable scales found in %s, checking all states...", origin_state)
+        return _find_best_cat_scale_cached(ship_from_coords, ship_to_coords, high_risk, None,
+                                           source_mtimes, total_distance)
     
-    if not viable_scales:
+    if best_idx < 0:
         return "No suitable scale found", float('inf'), None, None, None, None
     
-    # Sort scales by a combination of factors
-    for scale in viable_scales:
-        # Calculate score (lower is better)
-        scale['score'] = (
-            scale['deviation'] * 100 +  # Path deviation
-            scale['detour_cost'] / 50 +  # Cost factor
-            (0 if route_risk >= 0.7 and scale['from_origin'] <= 100 else scale['from_origin'] / 100)  # Origin proximity for high risk
-        )
-    
     # Get best scale based on combined score
-    best_scale = min(viable_scales, key=lambda x: x['score'])
-    scale_data = best_scale['scale']
+    best_pos = candidates[best_idx]
+    best_coords = (float(scale_lat[best_pos]), float(scale_lon[best_pos]))
     
     # Calculate final costs for best scale
     final_detour_cost, final_detour_distance, final_driver_pay, final_detour_time = calculate_detour_cost(
-        ship_from_coords, ship_to_coords,
-        (scale_data['Latitude'], scale_data['Longitude'])
+        ship_from_coords, ship_to_coords, best_coords, total_distance
     )
     
     return (
-        f"{scale_data['TruckstopName']} - {scale_data['InterstateCity']}, {scale_data['State']} (#{scale_data['CATScaleNumber']})",
+        scale_display_names[best_pos],
         final_detour_cost,
-        (scale_data['Latitude'], scale_data['Longitude']),
+        best_coords,
         final_driver_pay,
         final_detour_time,
         final_detour_distance
@@ -201,10 +355,9 @@ def compute_historical_risk_premium(liable_party):
     Calculate an average expense from historical incidents for the given liable party.
     This average expense is used as an additional risk premium.
     """
-    party_incidents = incident_data[incident_data["Liable Party Name"].str.lower() == liable_party.lower()]
-    if not party_incidents.empty:
-        avg_expense = party_incidents["Total Expense"].mean()
-        return avg_expense, len(party_incidents)
+    stats = party_expense_stats.get(liable_party.lower())
+    if stats:
+        return stats['mean'], int(stats['size'])
     return 0.0, 0
 
 # --- Streamlit UI ---
@@ -226,131 +379,110 @@ if st.button("Analyze Risk"):
         ship_from_city, ship_from_state = ship_from.split(", ")
         ship_to_city, ship_to_state = ship_to.split(", ")
         
-        ship_from_coords = get_coordinates(ship_from)
-        ship_to_coords = get_coordinates(ship_to)
+        # Look up the historical loss location first so all locations geocode in one batch
+        historical_loss = get_historical_loss(
+            ship_from_city, ship_from_state, ship_to_city, ship_to_state, incident_mtimes
+        )
+        
+        locations = [ship_from, ship_to]
+        if historical_loss:
+            loss_city, loss_state = historical_loss
+            locations.append(f"{loss_city}, {loss_state}")
+        
+        ship_from_coords, ship_to_coords, *loss_result = get_coordinates_many(locations)
         
         if ship_from_coords is None or ship_to_coords is None:
             st.error("Could not determine coordinates for one of the provided locations.")
         else:
             # Get historical data before maps
             historical_scale = None
-            historical_data = incident_data[
-                (incident_data['Ship From City'].str.upper() == ship_from_city.upper()) &
-                (incident_data['Ship From State'].str.upper() == ship_from_state.upper()) &
-                (incident_data['Ship To City'].str.upper() == ship_to_city.upper()) &
-                (incident_data['Ship To State'].str.upper() == ship_to_state.upper())
-            ]
+            if loss_result and loss_result[0]:
+                historical_scale = (loss_result[0], loss_city, loss_state)
             
-            if not historical_data.empty:
-                loss_city = historical_data.iloc[0]['Loss City']
-                loss_state = historical_data.iloc[0]['Loss State']
-                loss_loc = f"{loss_city}, {loss_state}"
-                loss_coords = get_coordinates(loss_loc)
-                if loss_coords:
-                    historical_scale = (loss_coords, loss_city, loss_state)
-
-            # Show initial historical analysis map
-            base_map = create_route_map(
-                ship_from_coords, 
-                ship_to_coords,
-                historical_scale=historical_scale
-            )
-            st.write("**Historical Analysis Map:**")
-            folium_static(base_map)
+            # Direct route distance is reused by the scale search and the results display
+            direct_route = point_distance_miles(ship_from_coords, ship_to_coords)
+
+            # One map for the whole analysis: route and historical loss location first,
+            # the recommendation layer is added once a scale is chosen
+            route_map = build_base_map(ship_from_coords, ship_to_coords, historical_scale)
             
-            # Calculate risk scores
+            # Calculate risk scores (ratings are loaded lazily, cached per ratings file)
+            route_risk_index, party_risk_index = get_latest_risk_ratings()
             route_risk, route_rating = calculate_route_risk(
                 ship_from_city, ship_from_state, 
                 ship_to_city, ship_to_state,
-                risk_ratings['Route Risk Ratings']
+                route_risk_index
             )
             
             liable_risk, liable_rating = calculate_liable_party_risk(
                 liable_party, 
-                risk_ratings['Liable Party Risk Ratings']
+                party_risk_index
             )
             
             # Find the optimal cat scale along the route
-            best_scale, detour_cost, scale_coords, driver_pay, detour_time, detour_distance = find_best_cat_scale(
-                ship_from_coords, ship_to_coords, route_risk, ship_from_state
+            scale_result = find_best_cat_scale(
+                ship_from_coords, ship_to_coords, route_risk, ship_from_state, direct_route
             )
             
             # Get recommendation
             should_scale, confidence, reasoning = get_risk_recommendation(
-                route_risk, liable_risk, detour_cost
+                route_risk, liable_risk, scale_result.detour_cost
             )
             
             # After finding best scale, update map with recommendation
             if should_scale:
-                isochrone = get_isochrone(ship_from_coords)
-                scales_nearby = find_scales_in_isochrone(isochrone, cat_scales)
+                isochrone, scales_nearby = get_isochrone_scales(ship_from_coords)
                 
-                updated_map = create_route_map(
+                add_route_analysis(
+                    route_map,
                     ship_from_coords,
                     ship_to_coords,
-                    scale_coords,
+                    scale_result.coords,
                     isochrone,
-                    scales_nearby,
-                    historical_scale
+                    scales_nearby
                 )
                 st.write("**Route Analysis Map:**")
-                folium_static(updated_map)
+                folium_static(finish_route_map(route_map))
                 
-                # Find historical loss location for this route
-                historical_data = incident_data[
-                    (incident_data['Ship From City'].str.upper() == ship_from_city.upper()) &
-                    (incident_data['Ship From State'].str.upper() == ship_from_state.upper()) &
-                    (incident_data['Ship To City'].str.upper() == ship_to_city.upper()) &
-                    (incident_data['Ship To State'].str.upper() == ship_to_state.upper())
-                ]
-                
-                if not historical_data.empty:
-                    # Get Loss City coordinates
-                    loss_city = historical_data.iloc[0]['Loss City']
-                    loss_state = historical_data.iloc[0]['Loss State']
-                    loss_loc = f"{loss_city}, {loss_state}"
-                    loss_coords = get_coordinates(loss_loc)
+                # Reuse the historical loss location resolved before the maps
+                if historical_scale:
+                    loss_coords, loss_city, loss_state = historical_scale
+                    
+                    # Calculate historical detour cost
+                    historical_detour_cost, historical_distance, historical_driver_pay, historical_detour_time = calculate_detour_cost(
+                        ship_from_coords, ship_to_coords, loss_coords, direct_route
+                    )
+                    
+                    # Compare locations
+                    has_scale = (str(loss_state).upper(), str(loss_city).upper()) in scale_location_keys
+                    
+                    st.write("\n**Historical Comparison:**")
+                    st.write(f"- Historical scale location: {loss_city}, {loss_state}")
+                    st.write(f"  - Historical Driver cost (time + mileage): ${historical_driver_pay:.2f}")
+                    st.write(f"  - Scale fee: ${CAT_SCALE_COST:.2f}")
+                    st.write(f"  - Total cost: ${historical_detour_cost:.2f}")
+                    
+                    #if not has_scale:
+                    #    st.write("Note: Historical location is not a registered CAT scale")
+                    
+                    savings = historical_detour_cost - scale_result.detour_cost
+                    if savings > 0:
+                        st.success(f"Potential savings using recommended scale: ${savings:.2f}")
+                    else:
+                        st.warning(f"Historical route was more efficient by: ${-savings:.2f}")
                     
-                    if loss_coords:
-                        # Calculate historical detour cost
-                        historical_detour_cost, historical_distance, historical_driver_pay, historical_detour_time = calculate_detour_cost(
-                            ship_from_coords, ship_to_coords, loss_coords
-                        )
-                        
-                        # Compare locations
-                        scale_data = cat_scales[
-                            (cat_scales['State'] == loss_state) &
-                            (cat_scales['InterstateCity'] == loss_city)
-                        ]
-                        
-                        st.write("\n**Historical Comparison:**")
-                        st.write(f"- Historical scale location: {loss_city}, {loss_state}")
-                        st.write(f"  - Historical Driver cost (time + mileage): ${historical_driver_pay:.2f}")
-                        st.write(f"  - Scale fee: ${CAT_SCALE_COST:.2f}")
-                        st.write(f"  - Total cost: ${historical_detour_cost:.2f}")
-                        
-                        #if scale_data.empty:
-                        #    st.write("Note: Historical location is not a registered CAT scale")
-                        
-                        savings = historical_detour_cost - detour_cost
-                        if savings > 0:
-                            st.success(f"Potential savings using recommended scale: ${savings:.2f}")
-                        else:
-                            st.warning(f"Historical route was more efficient by: ${-savings:.2f}")
-                        
                 # Continue with existing display code...
-                direct_route = geodesic(ship_from_coords, ship_to_coords).miles
-                to_scale = geodesic(ship_from_coords, scale_coords).miles
                 st.write(f"- Direct route: {direct_route:.1f} miles")
-                #st.write(f"- Distance to scale: {to_scale:.1f} miles")
                 #st.write(f"- Additional cost breakdown:")
-                #st.write(f"  - Base hourly pay: ({detour_time:.3f} hrs) × (${DRIVER_BASE_HOURLY:.2f}/hr) = ${detour_time * DRIVER_BASE_HOURLY:.2f}")
-                #st.write(f"  - Detour mile bonus: ({detour_distance:.1f} miles) × (${DRIVER_DETOUR_MILE_BONUS:.2f}/mile) = ${detour_distance * DRIVER_DETOUR_MILE_BONUS:.2f}")
+                #st.write(f"  - Base hourly pay: ({scale_result.detour_time:.3f} hrs) × (${DRIVER_BASE_HOURLY:.2f}/hr) = ${scale_result.detour_time * DRIVER_BASE_HOURLY:.2f}")
+                #st.write(f"  - Detour mile bonus: ({scale_result.detour_distance:.1f} miles) × (${DRIVER_DETOUR_MILE_BONUS:.2f}/mile) = ${scale_result.detour_distance * DRIVER_DETOUR_MILE_BONUS:.2f}")
                 st.write(f"  - Scale fee: ${CAT_SCALE_COST:.2f}")
-                st.write(f"  - **Total detour cost:** ${detour_cost:.2f}")
+                st.write(f"  - **Total detour cost:** ${scale_result.detour_cost:.2f}")
                 
-                st.success(f"Recommendation: **Stop at cat scale '{best_scale}'**\n"
+                st.success(f"Recommendation: **Stop at cat scale '{scale_result.name}'**\n"
                           f"Confidence: {confidence}\n"
                           f"Reason: {reasoning}")
             else:
+                st.write("**Historical Analysis Map:**")
+                folium_static(finish_route_map(route_map))
                 st.info(f"Recommendation: **Skip scaling**\nConfidence: {confidence}\nReason: {reasoning}")
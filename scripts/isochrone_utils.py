@@ -1,5 +1,7 @@
+import numpy as np
 import openrouteservice as ors
-from shapely.geometry import Point, shape
+import shapely
+from shapely.geometry import shape
 import os
 from dotenv import load_dotenv
 
@@ -9,35 +11,30 @@ load_dotenv()
 ORS_API_KEY = os.getenv('ORS_API_KEY')
 client = ors.Client(key=ORS_API_KEY)
 
-def get_isochrone(coords, drive_time_minutes=30):
-    """Get isochrone polygon for given coordinates and drive time"""
-    try:
-        # Convert drive time to seconds
-        drive_time_seconds = drive_time_minutes * 60
-        
-        # Request isochrone from OpenRouteService
-        isochrones = client.isochrones(
-            locations=[coords[::-1]],  # ORS expects [lon, lat]
-            profile='driving-hgv',     # Use HGV profile for trucks
-            range=[drive_time_seconds],
-            attributes=['area', 'reachfactor']
-        )
-        
-        # Convert to Shapely polygon for easy point-in-polygon testing
-        return shape(isochrones['features'][0]['geometry'])
-    except Exception as e:
-        print(f"Error getting isochrone: {e}")
-        return None
-
-def find_scales_in_isochrone(polygon, cat_scales_df):
-    """Find all CAT scales within the isochrone polygon"""
-    if polygon is None:
-        return []
+def fetch_isochrone(coords, drive_time_minutes=30):
+    """Request the isochrone polygon for given coordinates and drive time; raises on API errors"""
+    # Convert drive time to seconds
+    drive_time_seconds = drive_time_minutes * 60
     
-    scales_in_range = []
-    for _, scale in cat_scales_df.iterrows():
-        point = Point(scale['Longitude'], scale['Latitude'])
-        if polygon.contains(point):
-            scales_in_range.append(scale)
+    # Request isochrone from OpenRouteService
+    isochrones = client.isochrones(
+        locations=[coords[::-1]],  # ORS expects [lon, lat]
+        profile='driving-hgv',     # Use HGV profile for trucks
+        range=[drive_time_seconds],
+        attributes=['area', 'reachfactor']
+    )
     
-    return scales_in_range
+    # Convert to Shapely polygon for easy point-in-polygon testing
+    return shape(isochrones['features'][0]['geometry'])
+
+def scale_indices_in_isochrone(polygon, lats, lons):
+    """Positions of the coordinates (degrees) that fall inside the isochrone polygon"""
+    # Cheap bounding-box prefilter, then one vectorized point-in-polygon test
+    minx, miny, maxx, maxy = polygon.bounds
+    in_bbox = np.flatnonzero((lons >= minx) & (lons <= maxx) & (lats >= miny) & (lats <= maxy))
+    return in_bbox[shapely.contains_xy(polygon, lons[in_bbox], lats[in_bbox])]
+
+def scale_rows(cat_scales_df, indices):
+    """Map-ready (Latitude, Longitude, TruckstopName, InterstateCity) namedtuples for the given scale positions"""
+    rows = cat_scales_df[['Latitude', 'Longitude', 'TruckstopName', 'InterstateCity']].iloc[indices]
+    return list(rows.itertuples(index=False, name='Scale'))
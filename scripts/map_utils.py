@@ -3,8 +3,8 @@ from folium import plugins
 import streamlit as st
 from streamlit_folium import folium_static
 
-def create_route_map(ship_from_coords, ship_to_coords, scale_coords=None, isochrone_polygon=None, scales_in_range=None, historical_scale=None):
-    """Create an interactive map showing route, scale, and isochrone"""
+def build_base_map(ship_from_coords, ship_to_coords, historical_scale=None):
+    """Create the map with origin, destination, direct route and historical loss location"""
     # Create map centered between origin and destination
     center_lat = (ship_from_coords[0] + ship_to_coords[0]) / 2
     center_lon = (ship_from_coords[1] + ship_to_coords[1]) / 2
@@ -41,13 +41,19 @@ def create_route_map(ship_from_coords, ship_to_coords, scale_coords=None, isochr
         opacity=0.8
     ).add_to(m)
     
+    return m
+
+def add_route_analysis(m, ship_from_coords, ship_to_coords, scale_coords=None, isochrone_polygon=None, scales_in_range=None):
+    """Add the recommended scale, isochrone and nearby scales to a base map as one toggleable layer"""
+    analysis = folium.FeatureGroup(name='Route Analysis')
+    
     # Add recommended scale if provided
     if scale_coords:
         folium.Marker(
             scale_coords,
             popup='Recommended Scale',
             icon=folium.Icon(color='orange', icon='scale', prefix='fa')
-        ).add_to(m)
+        ).add_to(analysis)
         
         # Draw route with scale
         route_with_scale = [
@@ -61,7 +67,7 @@ def create_route_map(ship_from_coords, ship_to_coords, scale_coords=None, isochr
             weight=2,
             opacity=0.5,
             dashArray='5,10'
-        ).add_to(m)
+        ).add_to(analysis)
     
     # Add isochrone if provided
     if isochrone_polygon:
@@ -73,20 +79,23 @@ def create_route_map(ship_from_coords, ship_to_coords, scale_coords=None, isochr
                 'weight': 1,
                 'fillOpacity': 0.2
             }
-        ).add_to(m)
+        ).add_to(analysis)
     
     # Add other scales in range if provided
     if scales_in_range:
         for scale in scales_in_range:
             folium.CircleMarker(
-                location=(scale['Latitude'], scale['Longitude']),
+                location=(scale.Latitude, scale.Longitude),
                 radius=3,
-                popup=f"{scale['TruckstopName']} - {scale['InterstateCity']}",
+                popup=f"{scale.TruckstopName} - {scale.InterstateCity}",
                 color='gray',
                 fill=True
-            ).add_to(m)
+            ).add_to(analysis)
     
-    # Add layer control
+    analysis.add_to(m)
+    return analysis
+
+def finish_route_map(m):
+    """Add the layer control last, once every layer is on the map"""
     folium.LayerControl().add_to(m)
-    
     return m
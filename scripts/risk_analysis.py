@@ -1,8 +1,18 @@
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
+import numpy as np
 from datetime import datetime
 import os
 
+# String key columns stored as categoricals so groupby hashes integer codes
+CATEGORY_COLUMNS = [
+    'Ship From City', 'Ship From State', 'Ship To City', 'Ship To State',
+    'Loss City', 'Loss State', 'Liable Party Name', 'Primary Incident Cause Desc'
+]
+
+# Compact count type for the Parquet copies of the ratings; scores stay float64 so
+# threshold checks agree with the workbook and the stored risk_rating
+PARQUET_DTYPES = {'incident_count': np.int32}
+
 def calculate_risk_ratings(input_file):
     # Read the Excel file
     df = pd.read_excel(input_file)
@@ -18,7 +28,7 @@ def calculate_risk_ratings(input_file):
         (df['Total Expense'] > 0) |
         (df['Total Incurred'] > 0)
     )
-    filtered_df = df[mask]
+    filtered_df = df[mask].astype({col: 'category' for col in CATEGORY_COLUMNS})
    
     def process_group(group_by, group_cols):
         # Group and aggregate data
@@ -28,7 +38,7 @@ def calculate_risk_ratings(input_file):
             'avg_gross_weight': ('Gross Weight', 'mean')
         }
        
-        grouped = filtered_df.groupby(group_cols).agg(**agg_dict).reset_index()
+        grouped = filtered_df.groupby(group_cols, observed=True).agg(**agg_dict).reset_index()
        
         if len(grouped) == 0:
             return pd.DataFrame()
@@ -37,30 +47,29 @@ def calculate_risk_ratings(input_file):
         if group_by == 'Routes':
             # Group by route and liable party to find frequency
             liable_party_counts = filtered_df.groupby(
-                group_cols + ['Liable Party Name']
+                group_cols + ['Liable Party Name'], observed=True
             ).size().reset_index(name='frequency')
             
             # Get the most frequent liable party for each route
             most_common_liable = liable_party_counts.sort_values('frequency', ascending=False).groupby(
-                group_cols
+                group_cols, observed=True
             )['Liable Party Name'].first().reset_index()
             
             # Merge with main grouped dataframe
             grouped = grouped.merge(most_common_liable, on=group_cols, how='left')
        
-        # Normalize metrics
-        scaler = MinMaxScaler()
+        # Normalize metrics to [0, 1] (constant columns map to 0)
         metrics = grouped[['incident_count', 'total_penalties']]
-        if not metrics.empty:
-            grouped[['count_norm', 'penalties_norm']] = scaler.fit_transform(metrics)
-        else:
-            grouped[['count_norm', 'penalties_norm']] = 0
+        mins = metrics.min()
+        ranges = (metrics.max() - mins).replace(0, 1)
+        grouped[['count_norm', 'penalties_norm']] = ((metrics - mins) / ranges).to_numpy()
        
         # Calculate combined risk score (equal weights for incidents and penalties)
         grouped['risk_score'] = (grouped['count_norm'] + grouped['penalties_norm']) / 2
        
-        # Assign risk ratings
-        grouped['risk_rating'] = grouped['risk_score'].apply(get_rating)
+        # Assign risk ratings (High >= 0.7, Medium >= 0.4, otherwise Low)
+        risk_score = grouped['risk_score'].to_numpy()
+        grouped['risk_rating'] = np.select([risk_score >= 0.7, risk_score >= 0.4], ['High', 'Medium'], default='Low')
         return grouped.sort_values('risk_score', ascending=False)
    
     # Process routes and liable parties
@@ -70,15 +79,22 @@ def calculate_risk_ratings(input_file):
     liable_cols = ['Liable Party Name']
     liable_risk = process_group('Liable Parties', liable_cols)
    
-    # Save results to Excel
+    # Save results to Excel (streaming C-backed writer)
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     output_file = f'data/risk_ratings_{timestamp}.xlsx'
     
-    with pd.ExcelWriter(output_file) as writer:
+    with pd.ExcelWriter(output_file, engine='xlsxwriter') as writer:
         if not route_risk.empty:
             route_risk.to_excel(writer, sheet_name='Route Risk Ratings', index=False)
         if not liable_risk.empty:
             liable_risk.to_excel(writer, sheet_name='Liable Party Risk Ratings', index=False)
+    
+    # Parquet copies next to the workbook, which the app reads in preference to the XLSX
+    output_base = output_file.rsplit('.', 1)[0]
+    if not route_risk.empty:
+        route_risk.astype(PARQUET_DTYPES).to_parquet(f'{output_base}_routes.parquet', compression='zstd', index=False)
+    if not liable_risk.empty:
+        liable_risk.astype(PARQUET_DTYPES).to_parquet(f'{output_base}_parties.parquet', compression='zstd', index=False)
    
     print(f"Risk ratings generated successfully in '{output_file}'")
     
@@ -86,12 +102,6 @@ def calculate_risk_ratings(input_file):
     with open('data/latest_risk_ratings.txt', 'w') as f:
         f.write(output_file)
 
-def get_rating(score):
-    if score >= 0.7:
-        return 'High'
-    elif score >= 0.4:
-        return 'Medium'
-    else:
-        return 'Low'
 
-calculate_risk_ratings('data/Cargo_claims_data.xlsx')
\ No newline at end of file
+if __name__ == '__main__':
+    calculate_risk_ratings('data/Cargo_claims_data.xlsx')
@@ -1,38 +1,108 @@
-import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
-
-def calculate_route_risk(ship_from_city, ship_from_state, ship_to_city, ship_to_state, risk_ratings_df):
-    """Get risk score for a specific route"""
-    route_mask = (
-        (risk_ratings_df['Ship From City'].str.upper() == ship_from_city.upper()) &
-        (risk_ratings_df['Ship From State'].str.upper() == ship_from_state.upper()) &
-        (risk_ratings_df['Ship To City'].str.upper() == ship_to_city.upper()) &
-        (risk_ratings_df['Ship To State'].str.upper() == ship_to_state.upper())
+import logging
+import sys
+from functools import lru_cache
+from typing import NamedTuple
+import numpy as np
+from numba import njit
+
+logger = logging.getLogger(__name__)
+
+ROUTE_KEY_COLUMNS = ['Ship From City', 'Ship From State', 'Ship To City', 'Ship To State']
+RISK_STRING_COLUMNS = ROUTE_KEY_COLUMNS + ['Liable Party Name']
+
+# --- Recommendation Thresholds ---
+HIGH_RISK_THRESHOLD = 0.7       # Combined risk at or above which a scale is always recommended
+MEDIUM_RISK_THRESHOLD = 0.4     # Combined risk at or above which a scale is recommended if cheap
+MAX_MEDIUM_RISK_DETOUR_COST = 100  # Adjustable threshold
+
+# Recommendation codes from risk_recommendation_kernel, indexing the label tables below
+RECOMMENDATION_CONFIDENCE = np.array(["Low", "Medium", "Medium", "High"])
+RECOMMENDATION_REASONING = np.array([
+    "Low risk route and liable party history",
+    "Medium risk but high detour cost",
+    "Medium risk with reasonable detour cost",
+    "High risk route and/or liable party history",
+])
+
+class RiskRating(NamedTuple):
+    """Rating fields of one route or liable party, as stored in the lookup indexes"""
+    incident_count: int
+    total_penalties: float
+    count_norm: float
+    penalties_norm: float
+    risk_score: float
+    risk_rating: str
+
+# Only columns the lookup indexes read, so loaders can skip the rest of each sheet
+ROUTE_RATING_COLUMNS = ROUTE_KEY_COLUMNS + list(RiskRating._fields)
+PARTY_RATING_COLUMNS = ['Liable Party Name'] + list(RiskRating._fields)
+
+def _risk_ratings(risk_ratings_df):
+    """RiskRating per row, built from native column lists instead of full row dicts"""
+    return map(RiskRating._make, zip(*(risk_ratings_df[field].tolist() for field in RiskRating._fields)))
+
+@lru_cache(maxsize=8192)
+def _upper(value):
+    """Interned upper-case form of a route key part, so repeat lookups reuse one string object"""
+    return sys.intern(value.upper())
+
+def use_arrow_strings(risk_ratings_df):
+    """Store the text key columns of a risk ratings sheet as Arrow-backed strings"""
+    columns = [col for col in RISK_STRING_COLUMNS if col in risk_ratings_df.columns]
+    return risk_ratings_df.astype({col: 'string[pyarrow]' for col in columns})
+
+def build_route_index(risk_ratings_df):
+    """Map upper-cased (from city, from state, to city, to state) to the first matching RiskRating"""
+    if risk_ratings_df.empty:
+        return {}
+    route_keys = zip(*(risk_ratings_df[col].str.upper().tolist() for col in ROUTE_KEY_COLUMNS))
+    route_index = {}
+    for key, rating in zip(route_keys, _risk_ratings(risk_ratings_df)):
+        # Interned like _upper's results, so a hit compares key parts by identity
+        key = tuple(sys.intern(part) if isinstance(part, str) else part for part in key)
+        route_index.setdefault(key, rating)
+    return route_index
+
+def build_party_index(risk_ratings_df):
+    """Map liable party name to the first matching RiskRating"""
+    if risk_ratings_df.empty:
+        return {}
+    party_index = {}
+    for party, rating in zip(risk_ratings_df['Liable Party Name'], _risk_ratings(risk_ratings_df)):
+        party_index.setdefault(party, rating)
+    return party_index
+
+def calculate_route_risk(ship_from_city, ship_from_state, ship_to_city, ship_to_state, route_index):
+    """Get risk score for a specific route from an index built by build_route_index"""
+    risk_details = route_index.get(
+        (_upper(ship_from_city), _upper(ship_from_state), _upper(ship_to_city), _upper(ship_to_state))
     )
-    route_data = risk_ratings_df[route_mask]
     
-    print("\n=== Route Risk Analysis ===")
-    print(f"Searching for route: {ship_from_city}, {ship_from_state} to {ship_to_city}, {ship_to_state}")
-    print(f"Route data found: {len(route_data)} records")
-    if not route_data.empty:
-        risk_details = route_data.iloc[0].to_dict()
-        print("\nRisk Score Components:")
-        print(f"Incident Count: {risk_details.get('incident_count', 0)}")
-        print(f"Total Penalties: ${risk_details.get('total_penalties', 0):,.2f}")
-        print(f"Normalized Count: {risk_details.get('count_norm', 0):.3f}")
-        print(f"Normalized Penalties: {risk_details.get('penalties_norm', 0):.3f}")
-        print(f"Final Risk Score: {risk_details.get('risk_score', 0):.3f}")
-        return risk_details.get('risk_score', 0), risk_details.get('risk_rating', 'Low')
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Route risk lookup: %s, %s to %s, %s (found: %s)",
+                     ship_from_city, ship_from_state, ship_to_city, ship_to_state,
+                     'yes' if risk_details else 'no')
+        if risk_details:
+            logger.debug(
+                "Risk score components: incident count %s, total penalties $%s, "
+                "normalized count %.3f, normalized penalties %.3f, final risk score %.3f",
+                risk_details.incident_count, f"{risk_details.total_penalties:,.2f}",
+                risk_details.count_norm, risk_details.penalties_norm, risk_details.risk_score,
+            )
+    if risk_details:
+        return risk_details.risk_score, risk_details.risk_rating
     return 0.0, 'Low'
 
-def calculate_liable_party_risk(liable_party, risk_ratings_df):
-    """Get risk score for a liable party"""
-    party_mask = risk_ratings_df['Liable Party Name'] == liable_party
-    party_data = risk_ratings_df[party_mask]
-    print(f"Liable party data found: {len(party_data)} records")
-    print(f"Liable party risk calculation details: {party_data[['incident_count', 'total_penalties', 'risk_score']].to_dict('records')}")
-    if not party_data.empty:
-        return party_data.iloc[0]['risk_score'], party_data.iloc[0]['risk_rating']
+def calculate_liable_party_risk(liable_party, party_index):
+    """Get risk score for a liable party from an index built by build_party_index"""
+    party_data = party_index.get(liable_party)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Liable party data found: %s", 'yes' if party_data else 'no')
+        if party_data:
+            details = {k: getattr(party_data, k) for k in ('incident_count', 'total_penalties', 'risk_score')}
+            logger.debug("Liable party risk calculation details: %s", details)
+    if party_data:
+        return party_data.risk_score, party_data.risk_rating
     return 0.0, 'Low'
 
 def get_risk_recommendation(route_risk_score, liable_party_risk_score, detour_cost):
@@ -42,12 +112,43 @@ def get_risk_recommendation(route_risk_score, liable_party_risk_score, detour_co
     """
     combined_risk = (route_risk_score + liable_party_risk_score) / 2
     
-    if combined_risk >= 0.7:
+    if combined_risk >= HIGH_RISK_THRESHOLD:
         return True, "High", "High risk route and/or liable party history"
-    elif combined_risk >= 0.4:
-        if detour_cost < 100:  # Adjustable threshold
+    elif combined_risk >= MEDIUM_RISK_THRESHOLD:
+        if detour_cost < MAX_MEDIUM_RISK_DETOUR_COST:
             return True, "Medium", "Medium risk with reasonable detour cost"
         else:
             return False, "Medium", "Medium risk but high detour cost"
     else:
         return False, "Low", "Low risk route and liable party history"
+
+@njit('i1[::1](f8[::1], f8[::1], f8[::1])', cache=True)
+def risk_recommendation_kernel(route_risk_scores, liable_party_risk_scores, detour_costs):
+    """Recommendation code per shipment: 0 low, 1 medium/costly, 2 medium/cheap, 3 high.
+
+    Codes 2 and 3 recommend scaling. The three arrays must be the same length;
+    Numba does not bounds-check, so callers broadcast them first.
+    """
+    codes = np.empty(route_risk_scores.shape[0], dtype=np.int8)
+    for i in range(route_risk_scores.shape[0]):
+        combined_risk = (route_risk_scores[i] + liable_party_risk_scores[i]) / 2
+        if combined_risk >= HIGH_RISK_THRESHOLD:
+            codes[i] = 3
+        elif combined_risk >= MEDIUM_RISK_THRESHOLD:
+            codes[i] = 2 if detour_costs[i] < MAX_MEDIUM_RISK_DETOUR_COST else 1
+        else:
+            codes[i] = 0
+    return codes
+
+def get_risk_recommendation_vec(route_risk_scores, liable_party_risk_scores, detour_costs):
+    """
+    Vectorized get_risk_recommendation over arrays of shipments
+    Returns: (should_scale, confidence, reasoning) arrays
+    """
+    # Broadcast first (scalars stretch, mismatched shapes raise) so the kernel never reads past an input
+    inputs = np.broadcast_arrays(*(np.asarray(values, dtype=np.float64) for values in
+                                   (route_risk_scores, liable_party_risk_scores, detour_costs)))
+    codes = risk_recommendation_kernel(
+        *(np.ascontiguousarray(values).ravel() for values in inputs)
+    ).reshape(inputs[0].shape)
+    return codes >= 2, RECOMMENDATION_CONFIDENCE[codes], RECOMMENDATION_REASONING[codes]
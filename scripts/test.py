@@ -1,28 +1,56 @@
+import os
+import shelve
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from opencage.geocoder import OpenCageGeocode
+from dotenv import load_dotenv
 
-# Replace with your OpenCage API key
-key = 'd47f8c2e5d2b457f9128b8b583f80dd4'
-geocoder = OpenCageGeocode(key)
+CACHE_FILE = 'data/geocache_opencage'   # Persistent shelve of normalized query -> (fetched at, OpenCage results)
+CACHE_MAX_AGE_SECONDS = 30 * 86400      # Re-fetch entries older than 30 days
 
-# Define the query
-query = "Heartland Express - Poplar Bluff, MO #1018"
-query2= "4155 S Westwood Blvd, Poplar Bluff, MO"
+_cache_lock = threading.Lock()
 
-# Geocode the query
-result = geocoder.geocode(query)
-print(result)
-print("############################################")
-result2 = geocoder.geocode(query2)
-#print(result2)
-if result:
-    # Print the full address for result
-    print(f"Address: {result[0]['formatted']}")
-    print(f"Latitude: {result[0]['geometry']['lat']}")
-    print(f"Longitude: {result[0]['geometry']['lng']}")
-    # Print the full address for result2
-    print("############################################")
-    print(f"Address: {result2[0]['formatted']}")
-    print(f"Latitude: {result2[0]['geometry']['lat']}")
-    print(f"Longitude: {result2[0]['geometry']['lng']}")
-else:
-    print("Location not found.")
+def cached_geocode(geocoder, query):
+    """Geocode a query through the on-disk cache, calling OpenCage on a miss or a stale entry.
+
+    Empty (not found) results are not cached, so they are retried on the next run.
+    """
+    cache_key = query.strip().casefold()
+    with _cache_lock, shelve.open(CACHE_FILE) as cache:
+        entry = cache.get(cache_key)
+    if isinstance(entry, tuple) and time.time() - entry[0] < CACHE_MAX_AGE_SECONDS:
+        return entry[1]
+    
+    result = geocoder.geocode(query)
+    if result:
+        with _cache_lock, shelve.open(CACHE_FILE) as cache:
+            cache[cache_key] = (time.time(), result)
+    return result
+
+if __name__ == '__main__':
+    load_dotenv()
+    
+    # Get API key from environment variable
+    geocoder = OpenCageGeocode(os.environ['OPENCAGE_API_KEY'])
+    
+    # Define the queries
+    queries = [
+        "Heartland Express - Poplar Bluff, MO #1018",
+        "4155 S Westwood Blvd, Poplar Bluff, MO",
+    ]
+
+    # Geocode the queries concurrently so the network round trips overlap
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(partial(cached_geocode, geocoder), queries))
+
+    print(results[0])
+    for result in results:
+        print("############################################")
+        if result:
+            print(f"Address: {result[0]['formatted']}")
+            print(f"Latitude: {result[0]['geometry']['lat']}")
+            print(f"Longitude: {result[0]['geometry']['lng']}")
+        else:
+            print("Location not found.")